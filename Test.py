@@ -1,5 +1,10 @@
 """
 Quick test for Professor Balthazar's Magic Machine
+
+Each test uses a fixed session id, so its calls land in the same cassette
+slots on every run. Record once, then replay offline:
+    BALTHAZAR_CASSETTE_MODE=record python Test.py
+    BALTHAZAR_CASSETTE_MODE=replay python Test.py
 """
 
 import asyncio
@@ -9,6 +14,9 @@ import os
 # Add parent directory to path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
+from langchain_core.messages import HumanMessage
+
+from cassette import cassette_scope
 from consultation_agent import consult_professor_balthazar
 
 
@@ -17,8 +25,11 @@ async def test_basic_functionality():
     print("🧪 Testing Professor Balthazar basic consultation...")
     
     # Test basic consultation
-    session_id = await consult_professor_balthazar("I'm feeling bored today")
-    assert session_id.startswith("consultation_")
+    session_id = await consult_professor_balthazar(
+        "I'm feeling bored today",
+        session_id="consultation_test_basic"
+    )
+    assert session_id == "consultation_test_basic"
     print(f"✅ Basic consultation works! Session: {session_id}")
     
     return True
@@ -29,11 +40,14 @@ async def test_session_continuity():
     print("🧪 Testing session continuity...")
     
     # First message
-    response1, session_id = await consult_professor_balthazar("I need help with motivation")
+    session_id = await consult_professor_balthazar(
+        "I need help with motivation",
+        session_id="consultation_test_continuity"
+    )
     assert session_id is not None
     
     # Second message in same session
-    response2, same_id = await consult_professor_balthazar(
+    same_id = await consult_professor_balthazar(
         "My name is Alex", 
         session_id=session_id
     )
@@ -78,10 +92,15 @@ if __name__ == "__main__":
 # Upgrade Test: Multi-Agent
 async def test_multi_agent():
     from graph import app  # Your graph
-    inputs = {"messages": [HumanMessage(content="Angry boss reply?")]}
-    for output in app.stream(inputs):
-        for key, value in output.items():
-            print(f"Multi Test {key}: {value['messages'][-1].content}")
+    session_id = "consultation_test_multi_agent"
+    inputs = {
+        "messages": [HumanMessage(content="Angry boss reply?")],
+        "session_id": session_id,
+    }
+    with cassette_scope(session_id):
+        for output in app.stream(inputs):
+            for key, value in output.items():
+                print(f"Multi Test {key}: {value['messages'][-1].content}")
     return True
 
 # Run upgrade test
@@ -1,6 +1,8 @@
 import streamlit as st
 import asyncio
-from consultation_agent import consult_professor_balthazar  # Her function
+import uuid
+from consultation_agent import ask_professor_balthazar  # Her function
+from token_accounting import BudgetExceededError
 
 st.set_page_config(page_title="Professor Baltazar", page_icon="🎩")
 st.title("Professor Baltazar's Magic Machine")
@@ -9,12 +11,28 @@ st.caption("Type your problem—watch the magic! (Creative reframing + emotional
 if "responses" not in st.session_state:
     st.session_state.responses = []
 
+# One session per browser tab, so double submits queue behind each other
+if "session_id" not in st.session_state:
+    st.session_state.session_id = f"consultation_{uuid.uuid4().hex[:8]}"
+
+# Budgets are tracked per tenant: the signed-in user, else this browser session.
+# Anonymous tenants live in st.session_state, so reloading the page starts a
+# fresh tenant budget; deploy with sign-in to make TENANT_BUDGET a real cap.
+if "tenant_id" not in st.session_state:
+    st.session_state.tenant_id = st.experimental_user.get("email") or f"visitor_{uuid.uuid4().hex[:8]}"
+
 for resp in st.session_state.responses:
     st.write("**Baltazar:** " + resp)
 
 if prompt := st.chat_input("What's your problem today?"):
     with st.spinner("The machine whirs..."):
-        response = asyncio.run(consult_professor_balthazar(prompt))
+        try:
+            response = asyncio.run(ask_professor_balthazar(
+                prompt, st.session_state.session_id, tenant_id=st.session_state.tenant_id
+            ))
+        except BudgetExceededError:
+            st.warning("The Magic Machine has run out of steam for today! Please come back later.")
+            st.stop()
         # Your twist: If angry, add rephrase
         if "angry" in prompt.lower():
             response += "\n\nEmotional Tip: Rephrase to polite: 'I appreciate the feedback—let's align.'"
@@ -0,0 +1,272 @@
+"""
+Professor Balthazar Magic Machine - Cassettes
+Record/replay of LLM traffic for fast, deterministic evaluation
+
+Model calls (ask_gemini, which also backs graph.py's llm, and the ADK
+Gemini model) go through CASSETTE:
+1. Each request is reduced to a SHA-256 fingerprint of its JSON form
+2. Calls are keyed by (fingerprint, scope, sequence number), where the scope
+   is the session or eval case and the sequence counts identical requests
+   within it, so replay does not depend on thread timing
+3. "record" mode starts a fresh gzipped JSONL cassette and stores every
+   live response in it, written out as one compact gzip stream
+4. "replay" mode serves responses from an in-memory index of the cassette;
+   unmatched requests either raise, go live, or go live and get recorded
+
+Configure with BALTHAZAR_CASSETTE_MODE (off/record/replay),
+BALTHAZAR_CASSETTE (path) and BALTHAZAR_CASSETTE_ON_MISS (error/live/record).
+"""
+
+import atexit
+import contextlib
+import contextvars
+import gzip
+import hashlib
+import json
+import os
+import threading
+import zlib
+from typing import Any, Dict, Iterator, NamedTuple, Optional, Tuple
+
+OFF = "off"
+RECORD = "record"
+REPLAY = "replay"
+MODES = (OFF, RECORD, REPLAY)
+
+# What replay mode does with a request that is not on the cassette
+MISS_ERROR = "error"
+MISS_LIVE = "live"
+MISS_RECORD = "record"
+ON_MISS = (MISS_ERROR, MISS_LIVE, MISS_RECORD)
+
+DEFAULT_PATH = os.path.join("cassettes", "balthazar.jsonl.gz")
+
+# Pending recordings are written out after this many new entries
+FLUSH_EVERY = 100
+
+_scope: contextvars.ContextVar = contextvars.ContextVar("cassette_scope", default=None)
+
+
+class CassetteMissError(LookupError):
+    """Raised in strict replay mode when a request is not on the cassette."""
+
+
+def fingerprint(kind: str, request: Any) -> str:
+    """
+    Hashes a request into a stable cassette key.
+
+    Args:
+        kind: Call site, e.g. "ask_gemini", "adk_gemini"
+        request: JSON-serialisable request payload
+
+    Returns:
+        Hex SHA-256 digest
+    """
+    payload = json.dumps({"kind": kind, "request": request}, sort_keys=True,
+                         separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+@contextlib.contextmanager
+def cassette_scope(name: Optional[str]) -> Iterator[None]:
+    """
+    Keys every call made inside the block by a stable scope, e.g. a session id.
+
+    Args:
+        name: Scope name; calls outside any scope share the None scope
+    """
+    token = _scope.set(name)
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+class Ticket(NamedTuple):
+    """Identifies one call: replay() hands it out, record() stores under it."""
+    kind: str
+    key: str
+    scope: Optional[str]
+    seq: int
+
+
+class Cassette:
+    """
+    A fingerprint-indexed store of recorded model responses.
+
+    Callers ask replay() first; when it returns no response and the call goes
+    live, they pass the ticket it handed out to record(). Recordings are kept
+    in memory and written as a single gzip stream (atomically replacing the
+    file) every FLUSH_EVERY recordings, on close() and at exit.
+
+    Args:
+        path: Gzipped JSONL file holding the recordings
+        mode: OFF, RECORD or REPLAY
+        on_miss: MISS_ERROR, MISS_LIVE or MISS_RECORD (replay mode only)
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH, mode: str = OFF, on_miss: str = MISS_ERROR):
+        self._lock = threading.Lock()
+        self._dirty = 0
+        self.configure(path=path, mode=mode, on_miss=on_miss)
+        atexit.register(self.close)
+
+    @classmethod
+    def from_env(cls) -> "Cassette":
+        """Builds a cassette from the BALTHAZAR_CASSETTE_* environment variables."""
+        return cls(
+            path=os.environ.get("BALTHAZAR_CASSETTE", DEFAULT_PATH),
+            mode=os.environ.get("BALTHAZAR_CASSETTE_MODE", OFF),
+            on_miss=os.environ.get("BALTHAZAR_CASSETTE_ON_MISS", MISS_ERROR),
+        )
+
+    def configure(
+        self,
+        path: Optional[str] = None,
+        mode: Optional[str] = None,
+        on_miss: Optional[str] = None,
+    ) -> None:
+        """
+        Reconfigures the cassette in place, writing out pending recordings first.
+
+        Entering RECORD truncates the cassette file; entering REPLAY loads it.
+
+        Args:
+            path: New cassette file (optional)
+            mode: New mode (optional)
+            on_miss: New miss policy (optional)
+        """
+        mode = mode or getattr(self, "mode", OFF)
+        on_miss = on_miss or getattr(self, "on_miss", MISS_ERROR)
+        if mode not in MODES:
+            raise ValueError(f"Unknown cassette mode {mode!r}, expected one of {MODES}")
+        if on_miss not in ON_MISS:
+            raise ValueError(f"Unknown on_miss policy {on_miss!r}, expected one of {ON_MISS}")
+
+        with self._lock:
+            self._write()
+            self.path = path or getattr(self, "path", DEFAULT_PATH)
+            self.mode = mode
+            self.on_miss = on_miss
+            self._entries: Dict[Tuple[str, Optional[str], int], Dict[str, Any]] = {}
+            self._seq: Dict[Tuple[str, Optional[str]], int] = {}
+            self.hits = 0
+            self.misses = 0
+            self.recorded = 0
+            if self.mode == RECORD:
+                self._dirty = 1
+                self._write()
+            elif self.mode == REPLAY:
+                self._load()
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        try:
+            with gzip.open(self.path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries[(entry["key"], entry["scope"], entry["seq"])] = entry
+        except (EOFError, OSError, zlib.error, json.JSONDecodeError) as e:
+            # A recording interrupted mid-write: keep everything before the torn tail
+            print(f"⚠️ Cassette {self.path} is truncated ({e}); loaded {len(self._entries)} entries")
+
+    def _write(self) -> None:
+        """Rewrites the cassette as one gzip stream, if anything changed (lock held)."""
+        if not self._dirty:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            for entry in self._entries.values():
+                f.write(json.dumps(entry, separators=(",", ":"), default=str) + "\n")
+        os.replace(tmp_path, self.path)
+        self._dirty = 0
+
+    def flush(self) -> None:
+        """Writes pending recordings to the cassette file."""
+        with self._lock:
+            self._write()
+
+    def close(self) -> None:
+        """Writes pending recordings; called automatically at exit."""
+        self.flush()
+
+    # -------------------------------------------------------------------------
+    # Lookup and recording
+    # -------------------------------------------------------------------------
+
+    def replay(self, kind: str, request: Any) -> Tuple[Optional[Any], Optional[Ticket]]:
+        """
+        Looks up the recorded response for a request.
+
+        Args:
+            kind: Call site name
+            request: JSON-serialisable request payload
+
+        Returns:
+            (response, ticket): response is None if the caller should go live,
+            in which case it passes ticket to record()
+
+        Raises:
+            CassetteMissError: In replay mode with on_miss=MISS_ERROR
+        """
+        if self.mode == OFF:
+            return None, None
+        key, scope = fingerprint(kind, request), _scope.get()
+        with self._lock:
+            seq = self._seq.get((key, scope), 0)
+            self._seq[(key, scope)] = seq + 1
+            ticket = Ticket(kind, key, scope, seq)
+            if self.mode != REPLAY:
+                return None, ticket
+            entry = self._entries.get((key, scope, seq))
+            if entry is not None:
+                self.hits += 1
+                return entry["response"], ticket
+            self.misses += 1
+        if self.on_miss == MISS_ERROR:
+            raise CassetteMissError(
+                f"No cassette entry for {kind} request {key[:12]} (scope={scope}, seq={seq})"
+            )
+        return None, ticket
+
+    def record(self, ticket: Optional[Ticket], response: Any) -> None:
+        """
+        Stores a live response, if this cassette is recording.
+
+        Args:
+            ticket: The ticket replay() handed out for this call
+            response: JSON-serialisable response payload
+        """
+        if ticket is None or not (
+            self.mode == RECORD or (self.mode == REPLAY and self.on_miss == MISS_RECORD)
+        ):
+            return
+        with self._lock:
+            self._entries[(ticket.key, ticket.scope, ticket.seq)] = {
+                "key": ticket.key, "scope": ticket.scope, "seq": ticket.seq,
+                "kind": ticket.kind, "response": response,
+            }
+            self.recorded += 1
+            self._dirty += 1
+            if self._dirty >= FLUSH_EVERY:
+                self._write()
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns hit/miss/record counters for reporting."""
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "path": self.path,
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "recorded": self.recorded,
+            }
+
+
+CASSETTE = Cassette.from_env()
@@ -19,6 +19,7 @@ from typing import Dict, Any, Optional
 from google.genai import types
 from google.adk.agents import LlmAgent
 from google.adk.models.google_llm import Gemini
+from google.adk.models import LlmResponse
 from google.adk.runners import Runner
 from google.adk.sessions import InMemorySessionService
 from google.adk.memory import InMemoryMemoryService
@@ -37,6 +38,18 @@ import google.generativeai as genai
 import os
 from kaggle_secrets import UserSecretsClient
 
+# Per-session turn ordering with cross-session parallelism
+from session_executor import SessionExecutor
+
+# Token/cost accounting and budgets for every model call
+from token_accounting import (
+    LEDGER, CHEAP_MODEL, DEGRADE, REJECT,
+    accounting_scope, degrade_llm_request, current_tags, record_genai_usage,
+)
+
+# Record/replay of model traffic for fast, deterministic evals
+from cassette import CASSETTE, cassette_scope
+
 print("⚙️ Initializing Professor Balthazar's Magic Machine...")
 
 # Load your Google key
@@ -44,10 +57,17 @@ GOOGLE_API_KEY = UserSecretsClient().get_secret("GOOGLE_API_KEY")
 os.environ["GOOGLE_API_KEY"] = GOOGLE_API_KEY
 genai.configure(api_key=GOOGLE_API_KEY)
 model = genai.GenerativeModel('gemini-pro')  # Stable model for Kaggle
-
-def ask_gemini(prompt):
-    """Simple wrapper for Gemini calls."""
-    response = model.generate_content(prompt)
+cheap_model = genai.GenerativeModel(CHEAP_MODEL)  # Used once a budget runs low
+
+def ask_gemini(prompt, tool="ask_gemini"):
+    """Simple wrapper for Gemini calls, with token accounting, budgets and cassettes."""
+    cached, ticket = CASSETTE.replay("ask_gemini", prompt)
+    if cached is not None:
+        return cached["text"]
+    chosen = cheap_model if LEDGER.enforce_budget() == DEGRADE else model
+    response = chosen.generate_content(prompt)
+    record_genai_usage(chosen.model_name, prompt, response, tool=tool)
+    CASSETTE.record(ticket, {"text": response.text})
     return response.text
 
 # =============================================================================
@@ -66,6 +86,41 @@ retry_config = types.HttpRetryOptions(
 APP_NAME = "balthazar_magic_machine"
 USER_ID = "citizen"
 
+# Maximum number of sessions consulted in parallel
+MAX_CONCURRENT_SESSIONS = 4
+SESSION_EXECUTOR = SessionExecutor(max_workers=MAX_CONCURRENT_SESSIONS)
+
+
+class CassetteGemini(Gemini):
+    """
+    ADK Gemini model that records and replays responses through CASSETTE.
+
+    The fingerprint leaves out the model name, so a request downgraded by
+    budget_guard still matches its recording. Replayed responses carry no
+    usage metadata, so they are not charged to the token ledger. Responses are
+    stored as pydantic JSON so bytes fields (thought_signature, inline_data)
+    round-trip losslessly into the next request's fingerprint.
+    """
+
+    async def generate_content_async(self, llm_request, stream: bool = False):
+        request = llm_request.model_dump(
+            mode="json", exclude_none=True,
+            exclude={"model", "live_connect_config", "tools_dict"},
+        )
+        cached, ticket = CASSETTE.replay("adk_gemini", request)
+        if cached is not None:
+            for raw in cached["responses"]:
+                llm_response = LlmResponse.model_validate_json(raw)
+                yield llm_response.model_copy(update={"usage_metadata": None})
+            return
+
+        responses = []
+        async for llm_response in super().generate_content_async(llm_request, stream):
+            responses.append(llm_response.model_dump_json(exclude_none=True))
+            yield llm_response
+        CASSETTE.record(ticket, {"responses": responses})
+
+
 print("✅ Imports and configuration complete!")
 
 # =============================================================================
@@ -159,13 +214,13 @@ def creative_reframe(problem: str, perspective: str = "optimistic") -> Dict[str,
 def rephrase_angry(text: str) -> str:
     """Rephrases angry text politely (your emotional upgrade)."""
     prompt = f"Turn this angry message into a polite, empathetic reply: '{text}'"
-    return ask_gemini(prompt)
+    return ask_gemini(prompt, tool="rephrase_angry")
 
 
 def validate_advice(advice: str) -> dict:
     """Scores empathy/safety (your validator upgrade)."""
     prompt = f"Rate this advice: Empathy 1-10, Safe? Feedback: '{advice}'"
-    response = ask_gemini(prompt)
+    response = ask_gemini(prompt, tool="validate_advice")
     return {"empathy": 8, "safe": True, "feedback": "Good—kind tone!"}  # Simple parse
 
 
@@ -205,6 +260,66 @@ async def auto_save_to_memory(callback_context):
 print("✅ Memory system configured!")
 print(" - auto_save_to_memory: Automatically preserves all conversations")
 
+# =============================================================================
+# TOKEN ACCOUNTING - The Professor's Ledger
+# =============================================================================
+
+# Tools withheld from the agent once a budget runs low
+DEGRADED_DROP_TOOLS = ("rephrase_angry", "validate_advice")
+
+
+def budget_guard(callback_context, llm_request):
+    """
+    Enforces token budgets before each agent model call.
+
+    Past the soft budget the request is made cheaper (capped output, no
+    rephrase/validate tools, which each cost an extra ask_gemini call); past
+    the hard budget the call is skipped and a polite refusal is returned.
+
+    Args:
+        callback_context: ADK callback context
+        llm_request: The request about to be sent to the model
+
+    Returns:
+        An LlmResponse to short-circuit the call, or None to proceed
+    """
+    decision = LEDGER.check_budget()
+    if decision == REJECT:
+        print("💸 Budget exhausted - skipping model call")
+        return LlmResponse(content=types.Content(role="model", parts=[types.Part(
+            text="The Magic Machine has run out of steam for today! Please come back later. ⚙️✨"
+        )]))
+    if decision == DEGRADE:
+        degrade_llm_request(llm_request, drop_tools=DEGRADED_DROP_TOOLS)
+    return None
+
+
+def record_agent_usage(callback_context, llm_response):
+    """
+    Records tokens and cost for each agent model call.
+
+    Args:
+        callback_context: ADK callback context
+        llm_response: The response returned by the model
+
+    Returns:
+        None, leaving the response unchanged
+    """
+    usage = getattr(llm_response, "usage_metadata", None)
+    if usage is not None:
+        LEDGER.record(
+            getattr(llm_response, "model_version", None) or PROFESSOR_BALTHAZAR.model.model,
+            usage.prompt_token_count or 0,
+            usage.candidates_token_count or 0,
+            tool="agent",
+        )
+    return None
+
+
+print("✅ Token accounting configured!")
+print(" - budget_guard: Degrades or rejects calls past the session/tenant budget")
+print(" - record_agent_usage: Records tokens and cost for every agent turn")
+
 # =============================================================================
 # MAIN AGENT - Professor Balthazar (Original with Your Tools Added)
 # =============================================================================
@@ -212,7 +327,7 @@ print(" - auto_save_to_memory: Automatically preserves all conversations")
 # Create the final Professor Balthazar agent
 PROFESSOR_BALTHAZAR = LlmAgent(
     name="professor_balthazar",
-    model=Gemini(model="gemini-2.5-flash-lite", retry_options=retry_config),
+    model=CassetteGemini(model="gemini-2.5-flash-lite", retry_options=retry_config),
     description="Professor Balthazar - Creative problem-solver with magical solutions",
     instruction="""You are Professor Balthazar, the eccentric inventor and creative problem-solver!
 
@@ -248,6 +363,8 @@ PROFESSOR_BALTHAZAR = LlmAgent(
         FunctionTool(rephrase_angry),    # Your emotional upgrade
         FunctionTool(validate_advice)    # Your validator upgrade
     ],
+    before_model_callback=budget_guard,       # For token budgets
+    after_model_callback=record_agent_usage,  # For token/cost accounting
     after_agent_callback=auto_save_to_memory  # For automatic memory preservation
 )
 
@@ -265,7 +382,8 @@ print("   - Automatic memory for continuous learning")
 async def consult_professor_balthazar(
     problem: str, 
     session_id: Optional[str] = None,
-    use_memory: bool = True
+    use_memory: bool = True,
+    tenant_id: str = USER_ID
 ) -> str:
     """
     Main interface for consulting Professor Balthazar.
@@ -277,17 +395,64 @@ async def consult_professor_balthazar(
         problem: The problem or question to solve
         session_id: Optional session ID for conversation continuity
         use_memory: Whether to use memory for personalized responses
+        tenant_id: Tenant the consultation is billed to
         
     Returns:
         The session ID for future reference
     """
-    # Setup services
-    session_service = InMemorySessionService()
-    memory_service = InMemoryMemoryService() if use_memory else None
-    
     # Generate session ID if not provided
     if not session_id:
         session_id = f"consultation_{uuid.uuid4().hex[:8]}"
+
+    await ask_professor_balthazar(problem, session_id, use_memory, tenant_id)
+    return session_id
+
+
+async def ask_professor_balthazar(
+    problem: str,
+    session_id: str,
+    use_memory: bool = True,
+    tenant_id: str = USER_ID
+) -> str:
+    """
+    Like consult_professor_balthazar, but returns the Professor's reply.
+    
+    Args:
+        problem: The problem or question to solve
+        session_id: Session ID for conversation continuity
+        use_memory: Whether to use memory for personalized responses
+        tenant_id: Tenant the consultation is billed to
+        
+    Returns:
+        The Professor's final response text
+    """
+    # The executor runs turns on its own loop, so carry the caller's graph node tag
+    node = current_tags()["node"]
+
+    # Turns for the same session run one at a time, in arrival order
+    return await SESSION_EXECUTOR.run(
+        session_id,
+        lambda: _run_consultation(problem, session_id, use_memory, tenant_id, node)
+    )
+
+
+async def _run_consultation(
+    problem: str, session_id: str, use_memory: bool, tenant_id: str,
+    node: Optional[str] = None
+) -> str:
+    """Runs a single consultation turn; scheduled by SESSION_EXECUTOR."""
+    with accounting_scope(session_id=session_id, tenant_id=tenant_id, node=node), \
+            cassette_scope(session_id):
+        # Refuse up front once the session or tenant is out of budget
+        LEDGER.enforce_budget()
+        return await _consult(problem, session_id, use_memory)
+
+
+async def _consult(problem: str, session_id: str, use_memory: bool) -> str:
+    """Runs the agent for one turn and returns its final response text."""
+    # Setup services
+    session_service = InMemorySessionService()
+    memory_service = InMemoryMemoryService() if use_memory else None
     
     # Create runner with services
     runner_kwargs = {
@@ -347,7 +512,7 @@ async def consult_professor_balthazar(
     print("-"*70)
     print("✨ Consultation complete! The machine settles into peaceful silence. ⚙️✨\n")
     
-    return session_id
+    return response_text
 
 
 print("✅ Helper function created!")
@@ -1,34 +1,171 @@
-import json
-from graph import app
-
-cases = [{"prompt": "Bored at work—ideas?", "expected": "Creative reframe + steps"}]
-scores = []
-for case in cases:
-    inputs = {"messages": [HumanMessage(content=case["prompt"])]}
-    for output in app.stream(inputs):
-        resp = output["messages"][-1].content
-        # Simple score (expand with NLTK sentiment)
-        creativity = 1.0 if "invent" in resp.lower() else 0.8
-        scores.append({"case": case["prompt"][:50], "score": creativity, "response": resp})
-
-with open("eval_results.json", "w") as f:
-    json.dump(scores, f)
-print("Scores:", scores)  # Avg 0.9 → Good!
+"""
+Professor Balthazar Magic Machine - Evals
+Runs eval cases through the multi-agent graph, optionally against a cassette
+
+Usage:
+    python eval.py                                   # built-in cases, live
+    python eval.py --mode record                     # record a cassette
+    python eval.py --cases requests.jsonl --mode replay --workers 16
+    python eval.py --target agent                    # Day 4 evals, agent only
 
+Case files are JSON lines with a "prompt" (or "title"/"body") and an
+optional "expected". Each case runs in its own session, so cases run in
+parallel and replay the same recordings whatever the scheduling. Results
+and a throughput/score report are written to eval_results.json.
+"""
+
+import argparse
 import asyncio
-from consultation_agent import consult_professor_balthazar  # Her function
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
 
-cases = [
+from langchain_core.messages import HumanMessage
+
+from cassette import CASSETTE, MODES, ON_MISS, cassette_scope
+
+DEFAULT_CASES = [
+    {"prompt": "Bored at work—ideas?", "expected": "Creative reframe + steps"},
     {"prompt": "Work overwhelm", "expected": "Creative reframe"},
-    {"prompt": "Angry boss reply", "expected": "Polite rephrase"}
+    {"prompt": "Angry boss reply", "expected": "Polite rephrase"},
 ]
-scores = []
-for case in cases:
-    response = asyncio.run(consult_professor_balthazar(case["prompt"]))
-    score = 0.9 if "creative" in response.lower() or "opportunity" in response.lower() else 0.8
-    scores.append({"case": case["prompt"][:30], "score": score, "snippet": response[:100] + "..."})
-
-print("Day 4 Evals:")
-for s in scores:
-    print(f"Case: {s['case']} | Score: {s['score']} | Snippet: {s['snippet']}")
-print(f"Average: {sum(s['score'] for s in scores) / len(scores):.2f} —90% creative/robustness!")
+
+TARGETS = ("graph", "agent")
+
+
+def _normalise_case(case: Dict[str, Any], index: int) -> Dict[str, Any]:
+    prompt = case.get("prompt") or "\n\n".join(
+        part for part in (case.get("title"), case.get("body")) if part
+    )
+    return {
+        "id": case.get("request_id") or case.get("id") or f"case_{index}",
+        "prompt": prompt,
+        "expected": case.get("expected", ""),
+    }
+
+
+def load_cases(path: str) -> List[Dict[str, Any]]:
+    """
+    Loads eval cases from a JSON lines file.
+
+    Args:
+        path: File with one case per line
+
+    Returns:
+        List of cases with "prompt" and "expected" keys
+    """
+    with open(path) as f:
+        lines = [json.loads(line) for line in f if line.strip()]
+    return [_normalise_case(case, index) for index, case in enumerate(lines)]
+
+
+def score_response(text: str) -> float:
+    """Simple creativity score (expand with NLTK sentiment)."""
+    text = text.lower()
+    if "invent" in text:
+        return 1.0
+    if "creative" in text or "opportunity" in text:
+        return 0.9
+    return 0.8
+
+
+def run_case(target: str, case: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Runs one case in its own session and scores the response.
+
+    Args:
+        target: "graph" for the multi-agent team, "agent" for the ADK agent alone
+        case: Normalised eval case
+
+    Returns:
+        Dictionary with score, response, error and latency
+    """
+    session_id = f"eval_{case['id']}"
+    started = time.perf_counter()
+    try:
+        with cassette_scope(session_id):
+            if target == "agent":
+                from consultation_agent import ask_professor_balthazar
+                resp = asyncio.run(ask_professor_balthazar(case["prompt"], session_id))
+            else:
+                from graph import app
+                state = app.invoke({
+                    "messages": [HumanMessage(content=case["prompt"])],
+                    "session_id": session_id,
+                })
+                # Score every message the team produced
+                resp = "\n".join(m.content for m in state["messages"][1:])
+        error = None
+    except Exception as e:
+        resp, error = "", f"{type(e).__name__}: {e}"
+    return {
+        "case": case["prompt"][:50],
+        "id": case.get("id"),
+        "score": score_response(resp) if error is None else 0.0,
+        "response": resp,
+        "error": error,
+        "latency": time.perf_counter() - started,
+    }
+
+
+def report(scores: List[Dict[str, Any]], elapsed: float) -> Dict[str, Any]:
+    """Builds the throughput and score summary."""
+    ok = [s for s in scores if s["error"] is None]
+    latencies = sorted(s["latency"] for s in scores)
+
+    def percentile(p: float) -> float:
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else 0.0
+
+    return {
+        "cases": len(scores),
+        "errors": len(scores) - len(ok),
+        "elapsed_seconds": elapsed,
+        "cases_per_second": len(scores) / elapsed if elapsed else 0.0,
+        "latency_p50": percentile(0.50),
+        "latency_p95": percentile(0.95),
+        "avg_score": sum(s["score"] for s in ok) / len(ok) if ok else 0.0,
+        "cassette": CASSETTE.stats(),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Evaluate Professor Balthazar")
+    parser.add_argument("--cases", help="JSON lines case file (default: built-in cases)")
+    parser.add_argument("--target", choices=TARGETS, default="graph")
+    parser.add_argument("--workers", type=int, default=1, help="Cases run in parallel")
+    parser.add_argument("--mode", choices=MODES, default=CASSETTE.mode)
+    parser.add_argument("--cassette", default=CASSETTE.path)
+    parser.add_argument("--on-miss", choices=ON_MISS, default=CASSETTE.on_miss)
+    parser.add_argument("--output", default="eval_results.json")
+    args = parser.parse_args()
+
+    CASSETTE.configure(path=args.cassette, mode=args.mode, on_miss=args.on_miss)
+    # Import (and print banners) before timing starts
+    import consultation_agent  # noqa: F401
+    if args.target == "graph":
+        import graph  # noqa: F401
+
+    if args.cases:
+        cases = load_cases(args.cases)
+    else:
+        cases = [_normalise_case(case, index) for index, case in enumerate(DEFAULT_CASES)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        scores = list(pool.map(lambda case: run_case(args.target, case), cases))
+    CASSETTE.close()
+    summary = report(scores, time.perf_counter() - started)
+
+    with open(args.output, "w") as f:
+        json.dump({"report": summary, "scores": scores}, f, indent=2)
+
+    for s in scores:
+        status = s["error"] or f"Score: {s['score']}"
+        print(f"Case: {s['case']} | {status}")
+    print(f"Cases: {summary['cases']} | Errors: {summary['errors']} | "
+          f"{summary['cases_per_second']:.1f} cases/s | p95: {summary['latency_p95']:.3f}s")
+    print(f"Average: {summary['avg_score']:.2f} | Cassette: {summary['cassette']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,23 @@
 # Imports (add to her consultation_agent.py or separate)
 from langgraph.graph import StateGraph, END
-from langchain_core.messages import HumanMessage
+from langchain_core.messages import AIMessage, HumanMessage
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.runnables import RunnableLambda
+from langchain_core.tools import tool
 from typing import TypedDict, Annotated, Sequence
 import operator
 
 # Her Tools (copy from consultation_agent.py)
 # ... (save_user_context, creative_reframe, etc.)
 
+def _ask_gemini(prompt) -> AIMessage:
+    """Her ask_gemini as a LangChain llm (cassettes and token accounting included)."""
+    from consultation_agent import ask_gemini
+    text = prompt.to_string() if hasattr(prompt, "to_string") else str(prompt)
+    return AIMessage(content=ask_gemini(text, tool="graph_llm"))
+
+llm = RunnableLambda(_ask_gemini)
+
 # New Tools for Your Twist (Emotional Rephrasing)
 @tool
 def generate_steps(problem: str) -> list:
@@ -45,42 +55,54 @@ def supervisor_node(state):
     route = "rephraser" if "angry" in msg.content.lower() else "stepper"
     return {"messages": [msg], "next": route}
 
-# Build \& Compile
-workflow = StateGraph(BaltazarState)
-# Add nodes/edges...
-app = workflow.compile()
-
-print("✅ Multi-Agent Graph Ready—Test: app.invoke({'messages': [HumanMessage('Angry email help?')]} )")
+# Build & Compile: the multi-agent team below
 
 from langgraph.graph import StateGraph, END
 from langchain_core.messages import HumanMessage
 from typing import TypedDict, Annotated, Sequence
 import operator
 import asyncio
+from token_accounting import accounting_scope
 
 class BaltazarState(TypedDict):
     messages: Annotated[Sequence[HumanMessage], operator.add]
     next: str
+    session_id: str  # One per conversation (and per eval case)
+    tenant_id: str   # Who the conversation's model calls are billed to
+
+
+def _billing(state, node):
+    """Accounting scope for a node: its session, tenant and node name."""
+    return accounting_scope(
+        session_id=state.get("session_id"), tenant_id=state.get("tenant_id"), node=node
+    )
+
 
 def supervisor_node(state):
-    last = state["messages"][-1].content.lower()
+    problem = state["messages"][-1].content
+    last = problem.lower()
     if "angry" in last or "reply" in last:
         return {"messages": [HumanMessage(content="Route to rephraser")], "next": "rephraser"}
     elif "steps" in last:
         return {"messages": [HumanMessage(content="Route to stepper")], "next": "stepper"}
     else:
-        from consultation_agent import consult_professor_balthazar
-        response = asyncio.run(consult_professor_balthazar(last.content, "test_session"))
+        from consultation_agent import ask_professor_balthazar, USER_ID
+        session_id = state.get("session_id") or "test_session"
+        with accounting_scope(node="supervisor"):
+            response = asyncio.run(ask_professor_balthazar(
+                problem, session_id, tenant_id=state.get("tenant_id") or USER_ID
+            ))
         return {"messages": [HumanMessage(content=response)], "next": "validator"}
 
 def rephraser_node(state):
-    text = state["messages"][-1].content
+    text = state["messages"][0].content  # The user's message, not the routing note
     from consultation_agent import rephrase_angry  # Your tool
-    rephrased = rephrase_angry(text)
+    with _billing(state, "rephraser"):
+        rephrased = rephrase_angry(text)
     return {"messages": [HumanMessage(content=f"Calmer reply: {rephrased}")], "next": "validator"}
 
 def stepper_node(state):
-    problem = state["messages"][-1].content
+    problem = state["messages"][0].content
     from consultation_agent import creative_reframe
     reframe = creative_reframe(problem, "practical")
     steps = reframe["reframed_problem"].split(".")[:3]
@@ -88,8 +110,9 @@ def stepper_node(state):
 
 def validator_node(state):
     advice = state["messages"][-1].content
-    from consultation_agent import validate_response
-    valid = validate_response(advice)
+    from consultation_agent import validate_advice
+    with _billing(state, "validator"):
+        valid = validate_advice(advice)
     feedback = f"Empathy: {valid['empathy']}/10 | Safe: {valid['safe']}"
     return {"messages": [HumanMessage(content=f"Approved: {feedback}")], "next": END}
 
@@ -0,0 +1,186 @@
+"""
+Professor Balthazar Magic Machine - Session Executor
+Per-session ordered execution with cross-session parallelism
+
+Two messages for the same session (a Streamlit double submit, two browser
+tabs) must never run against that session at the same time. The executor:
+1. Keeps one FIFO queue of turns per session_id (arrival order preserved)
+2. Runs different sessions in parallel on a bounded pool of workers
+3. Schedules sessions round-robin, one turn at a time, so a chatty
+   session cannot starve the others
+4. Tracks queue depth and wait time metrics
+
+Each worker is a thread with its own event loop, so callers on any thread
+or event loop (including Streamlit's per-rerun asyncio.run) share the same
+queues, and a turn that blocks on synchronous work (ADK FunctionTools calling
+ask_gemini) only holds up its own worker, never the other sessions.
+"""
+
+import asyncio
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Tuple
+
+# A turn is a zero-argument callable returning the coroutine to run, plus
+# the future to resolve and the time it was enqueued.
+TurnFactory = Callable[[], Awaitable[Any]]
+_Turn = Tuple[TurnFactory, Future, float]
+
+
+class SessionExecutor:
+    """
+    Serialises turns within a session and runs sessions in parallel.
+
+    Args:
+        max_workers: Maximum number of sessions executing at the same time
+    """
+
+    def __init__(self, max_workers: int = 4):
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+        self.max_workers = max_workers
+
+        self._lock = threading.Lock()
+        self._queues: Dict[str, Deque[_Turn]] = {}
+        self._running: set = set()
+        self._ready: "queue.Queue[str]" = queue.Queue()
+        self._threads: List[threading.Thread] = []
+
+        # Metrics
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._max_depth = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    # -------------------------------------------------------------------------
+    # Lifecycle
+    # -------------------------------------------------------------------------
+
+    def _ensure_started(self) -> None:
+        """Starts the worker threads on first use."""
+        with self._lock:
+            if self._threads:
+                return
+            for index in range(self.max_workers):
+                thread = threading.Thread(
+                    target=self._worker, name=f"balthazar-session-worker-{index}", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    # -------------------------------------------------------------------------
+    # Submission
+    # -------------------------------------------------------------------------
+
+    def submit(self, session_id: str, turn: TurnFactory) -> Future:
+        """
+        Queues a turn for a session.
+
+        Args:
+            session_id: Session the turn belongs to
+            turn: Zero-argument callable returning the coroutine to run
+
+        Returns:
+            A concurrent.futures.Future resolved with the turn's result
+        """
+        self._ensure_started()
+        future: Future = Future()
+        with self._lock:
+            pending = self._queues.setdefault(session_id, deque())
+            pending.append((turn, future, time.monotonic()))
+            self._submitted += 1
+            self._max_depth = max(self._max_depth, len(pending))
+            # Only schedule sessions that are neither running nor already waiting
+            if len(pending) == 1 and session_id not in self._running:
+                self._ready.put(session_id)
+        return future
+
+    async def run(self, session_id: str, turn: TurnFactory) -> Any:
+        """
+        Queues a turn and awaits its result from any event loop.
+
+        Args:
+            session_id: Session the turn belongs to
+            turn: Zero-argument callable returning the coroutine to run
+
+        Returns:
+            Whatever the turn's coroutine returns
+        """
+        return await asyncio.wrap_future(self.submit(session_id, turn))
+
+    # -------------------------------------------------------------------------
+    # Scheduling
+    # -------------------------------------------------------------------------
+
+    def _worker(self) -> None:
+        """Takes one turn from the next ready session, then requeues it."""
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        while True:
+            session_id = self._ready.get()
+            with self._lock:
+                pending = self._queues.get(session_id)
+                if not pending:
+                    continue
+                turn, future, enqueued_at = pending.popleft()
+                self._running.add(session_id)
+
+            waited = time.monotonic() - enqueued_at
+            failed = False
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(loop.run_until_complete(turn()))
+                    except BaseException as e:
+                        # Includes CancelledError: the caller sees it, the worker survives
+                        failed = True
+                        future.set_exception(e)
+            finally:
+                with self._lock:
+                    self._running.discard(session_id)
+                    self._completed += 1
+                    self._failed += int(failed)
+                    self._total_wait += waited
+                    self._max_wait = max(self._max_wait, waited)
+                    if pending:
+                        # Back of the line: other sessions get a turn first
+                        self._ready.put(session_id)
+                    else:
+                        del self._queues[session_id]
+
+    # -------------------------------------------------------------------------
+    # Metrics
+    # -------------------------------------------------------------------------
+
+    def queue_depth(self, session_id: str) -> int:
+        """Returns the number of turns waiting for a session."""
+        with self._lock:
+            return len(self._queues.get(session_id, ()))
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns a snapshot of executor metrics.
+
+        Returns:
+            Dictionary with queue depths, throughput counters and wait times
+        """
+        with self._lock:
+            depths = {sid: len(q) for sid, q in self._queues.items() if q}
+            completed = self._completed
+            return {
+                "max_workers": self.max_workers,
+                "active_sessions": len(self._running),
+                "queued_turns": sum(depths.values()),
+                "queue_depths": depths,
+                "max_queue_depth": self._max_depth,
+                "submitted": self._submitted,
+                "completed": completed,
+                "failed": self._failed,
+                "avg_wait_seconds": self._total_wait / completed if completed else 0.0,
+                "max_wait_seconds": self._max_wait,
+            }
@@ -0,0 +1,181 @@
+"""
+Behaviour tests for record/replay cassettes
+"""
+
+import gzip
+import os
+import threading
+
+import pytest
+
+from cassette import (
+    MISS_ERROR, MISS_LIVE, MISS_RECORD, OFF, RECORD, REPLAY,
+    Cassette, CassetteMissError, cassette_scope,
+)
+
+
+def _call(cassette, prompt, live):
+    """Mirrors how ask_gemini goes through the cassette."""
+    cached, ticket = cassette.replay("ask_gemini", prompt)
+    if cached is not None:
+        return cached["text"]
+    text = live(prompt)
+    cassette.record(ticket, {"text": text})
+    return text
+
+
+def _live(answers):
+    calls = []
+
+    def live(prompt):
+        calls.append(prompt)
+        return answers.pop(0)
+    return live, calls
+
+
+def _offline(prompt):
+    raise AssertionError(f"unexpected live call for {prompt!r}")
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "cassettes" / "test.jsonl.gz")
+
+
+def test_record_then_replay_round_trip(path):
+    cassette = Cassette(path, RECORD)
+    live, calls = _live(["first", "second", "other"])
+    assert _call(cassette, "hi", live) == "first"
+    assert _call(cassette, "hi", live) == "second"
+    assert _call(cassette, "bye", live) == "other"
+    assert len(calls) == 3
+    cassette.close()
+
+    replay = Cassette(path, REPLAY)
+    # Identical requests replay their recordings in order
+    assert _call(replay, "hi", _offline) == "first"
+    assert _call(replay, "hi", _offline) == "second"
+    assert _call(replay, "bye", _offline) == "other"
+    assert replay.stats()["hits"] == 3
+
+
+def test_off_mode_always_goes_live(path):
+    cassette = Cassette(path, OFF)
+    live, calls = _live(["a", "b"])
+    _call(cassette, "hi", live)
+    _call(cassette, "hi", live)
+    assert len(calls) == 2
+    assert cassette.stats()["entries"] == 0
+
+
+def test_strict_replay_raises_on_miss(path):
+    Cassette(path, RECORD)
+    replay = Cassette(path, REPLAY, on_miss=MISS_ERROR)
+    with pytest.raises(CassetteMissError):
+        _call(replay, "unknown", _offline)
+
+
+def test_live_miss_goes_live_without_recording(path):
+    replay = Cassette(path, REPLAY, on_miss=MISS_LIVE)
+    live, calls = _live(["live answer"])
+    assert _call(replay, "unknown", live) == "live answer"
+    assert replay.stats()["recorded"] == 0
+    assert Cassette(path, REPLAY).stats()["entries"] == 0
+
+
+def test_record_miss_adds_to_the_cassette(path):
+    replay = Cassette(path, REPLAY, on_miss=MISS_RECORD)
+    live, calls = _live(["fresh"])
+    assert _call(replay, "new", live) == "fresh"
+    replay.close()
+    assert _call(Cassette(path, REPLAY), "new", _offline) == "fresh"
+
+
+def test_rerecording_replaces_old_responses(path):
+    for answer in ("v1", "v2"):
+        recorder = Cassette(path, RECORD)
+        _call(recorder, "hi", _live([answer])[0])
+        recorder.close()
+    replay = Cassette(path, REPLAY)
+    assert replay.stats()["entries"] == 1
+    assert _call(replay, "hi", _offline) == "v2"
+
+
+def test_replay_is_keyed_by_scope_not_thread_timing(path):
+    recorder = Cassette(path, RECORD)
+    for case in ("a", "b"):
+        with cassette_scope(case):
+            _call(recorder, "same prompt", lambda prompt, case=case: f"answer {case}")
+    recorder.close()
+
+    replay = Cassette(path, REPLAY)
+    results = {}
+
+    def run(case):
+        with cassette_scope(case):
+            results[case] = _call(replay, "same prompt", _offline)
+
+    # Replay in the opposite order, concurrently
+    threads = [threading.Thread(target=run, args=(case,)) for case in ("b", "a")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == {"a": "answer a", "b": "answer b"}
+
+
+def test_concurrent_identical_requests_keep_their_own_sequence_numbers(path):
+    recorder = Cassette(path, RECORD)
+    # Both calls go live before either records, finishing in reverse order
+    first, first_ticket = recorder.replay("ask_gemini", "hi")
+    second, second_ticket = recorder.replay("ask_gemini", "hi")
+    recorder.record(second_ticket, {"text": "second"})
+    recorder.record(first_ticket, {"text": "first"})
+    recorder.close()
+
+    replay = Cassette(path, REPLAY)
+    assert _call(replay, "hi", _offline) == "first"
+    assert _call(replay, "hi", _offline) == "second"
+
+
+def test_cassette_is_written_as_one_compact_stream(path):
+    recorder = Cassette(path, RECORD)
+    for i in range(50):
+        _call(recorder, f"prompt {i}", lambda prompt: "the same long answer " * 20)
+    recorder.close()
+
+    with open(path, "rb") as f:
+        data = f.read()
+    # One gzip member: the magic header appears once
+    assert data.count(b"\x1f\x8b\x08") == 1
+    assert len(data) < len(gzip.decompress(data)) / 5
+    assert Cassette(path, REPLAY).stats()["entries"] == 50
+
+
+def test_torn_tail_keeps_earlier_entries(path):
+    recorder = Cassette(path, RECORD)
+    for i in range(20):
+        _call(recorder, f"prompt {i}", lambda prompt: f"answer to {prompt}")
+    recorder.close()
+    with open(path, "rb") as f:
+        data = f.read()
+    with open(path, "wb") as f:
+        f.write(data[: len(data) - 40])
+
+    replay = Cassette(path, REPLAY)
+    entries = replay.stats()["entries"]
+    assert 0 < entries < 20
+    assert _call(replay, "prompt 0", _offline) == "answer to prompt 0"
+
+
+def test_pending_recordings_are_written_on_reconfigure(path):
+    recorder = Cassette(path, RECORD)
+    _call(recorder, "hi", lambda prompt: "hello")
+    recorder.configure(mode=REPLAY)
+    assert _call(recorder, "hi", _offline) == "hello"
+    assert not os.path.exists(f"{path}.tmp")
+
+
+def test_unknown_mode_is_rejected(path):
+    with pytest.raises(ValueError):
+        Cassette(path, "rewind")
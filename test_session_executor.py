@@ -0,0 +1,93 @@
+"""
+Behaviour tests for the session executor
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from session_executor import SessionExecutor
+
+
+def _turn(log, session_id, index, delay=0.02):
+    async def turn():
+        log.append(("start", session_id, index))
+        await asyncio.sleep(delay)
+        log.append(("end", session_id, index))
+        return session_id, index
+    return turn
+
+
+def test_turns_in_a_session_run_in_order_without_overlap():
+    executor = SessionExecutor(max_workers=4)
+    log = []
+
+    async def main():
+        return await asyncio.gather(*[executor.run("a", _turn(log, "a", i)) for i in range(5)])
+
+    assert asyncio.run(main()) == [("a", i) for i in range(5)]
+    assert log == [(event, "a", i) for i in range(5) for event in ("start", "end")]
+
+
+def test_sessions_are_scheduled_round_robin():
+    executor = SessionExecutor(max_workers=1)
+    log = []
+
+    async def main():
+        futures = [executor.run("chatty", _turn(log, "chatty", i)) for i in range(3)]
+        futures.append(executor.run("quiet", _turn(log, "quiet", 0)))
+        await asyncio.gather(*futures)
+
+    asyncio.run(main())
+    starts = [(session_id, index) for event, session_id, index in log if event == "start"]
+    # The quiet session gets its turn before the chatty session's backlog
+    assert starts.index(("quiet", 0)) == 1
+
+
+def test_blocking_turns_in_different_sessions_run_in_parallel():
+    executor = SessionExecutor(max_workers=2)
+
+    async def blocking():
+        time.sleep(0.3)
+
+    async def main():
+        await asyncio.gather(executor.run("a", blocking), executor.run("b", blocking))
+
+    started = time.monotonic()
+    asyncio.run(main())
+    assert time.monotonic() - started < 0.55
+
+
+@pytest.mark.parametrize("error", [ValueError("boom"), asyncio.CancelledError()])
+def test_failed_turn_does_not_wedge_the_session(error):
+    executor = SessionExecutor(max_workers=1)
+
+    async def failing():
+        raise error
+
+    async def ok():
+        return "ok"
+
+    with pytest.raises(type(error)):
+        executor.submit("a", failing).result(timeout=2)
+    assert executor.submit("a", ok).result(timeout=2) == "ok"
+
+    stats = executor.stats()
+    assert stats["active_sessions"] == 0
+    assert stats["failed"] == 1
+    assert stats["completed"] == 2
+
+
+def test_stats_report_queue_depth_and_wait():
+    executor = SessionExecutor(max_workers=1)
+    log = []
+    futures = [executor.submit("a", _turn(log, "a", i)) for i in range(3)]
+    assert executor.stats()["max_queue_depth"] >= 2
+    for future in futures:
+        future.result(timeout=2)
+
+    stats = executor.stats()
+    assert stats["queued_turns"] == 0
+    assert stats["submitted"] == stats["completed"] == 3
+    assert stats["max_wait_seconds"] >= stats["avg_wait_seconds"] > 0
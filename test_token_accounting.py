@@ -0,0 +1,143 @@
+"""
+Behaviour tests for token accounting and budgets
+"""
+
+import json
+
+import pytest
+
+import token_accounting as ta
+from token_accounting import (
+    BudgetExceededError, DEGRADE, OK, REJECT, TokenLedger, accounting_scope,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _ledger(**kwargs):
+    kwargs.setdefault("flush_path", None)
+    kwargs.setdefault("session_budget", {"soft": 0.001, "hard": 0.002})
+    return TokenLedger(**kwargs)
+
+
+def test_calls_are_tagged_and_aggregated():
+    ledger = _ledger()
+    with accounting_scope(session_id="s1", tenant_id="t1", node="rephraser"):
+        ledger.record("gemini-pro", 1000, 200, tool="ask_gemini")
+    summary = ledger.summary()
+    assert summary["total"]["calls"] == 1
+    assert summary["session_id"]["s1"]["prompt_tokens"] == 1000
+    assert summary["tool"]["ask_gemini"]["completion_tokens"] == 200
+    assert summary["node"]["rephraser"]["cost"] == pytest.approx(0.0008)
+
+
+def test_versioned_model_names_use_family_pricing():
+    assert ta.estimate_cost("models/gemini-2.5-flash-lite-preview-06-17", 1_000_000, 0) == \
+        pytest.approx(ta.MODEL_PRICING["gemini-2.5-flash-lite"][0])
+    assert ta.estimate_cost("gemini-2.5-flash-001", 1_000_000, 0) == \
+        pytest.approx(ta.MODEL_PRICING["gemini-2.5-flash"][0])
+    assert ta.estimate_cost("mystery-model", 1_000_000, 0) == pytest.approx(ta.DEFAULT_PRICING[0])
+
+
+def test_soft_budget_degrades_and_hard_budget_rejects():
+    ledger = _ledger()
+    with accounting_scope(session_id="s1"):
+        assert ledger.check_budget() == OK
+        ledger.record("gemini-pro", 2000, 0)  # $0.001
+        assert ledger.check_budget() == DEGRADE
+        ledger.record("gemini-pro", 2000, 0)  # $0.002
+        assert ledger.check_budget() == REJECT
+        with pytest.raises(BudgetExceededError):
+            ledger.enforce_budget()
+    assert ledger.check_budget(session_id="s2") == OK
+
+
+def test_tenant_budget_resets_when_the_window_rolls_over():
+    clock = FakeClock()
+    ledger = _ledger(session_budget={}, tenant_budget={"hard": 0.001},
+                     budget_window=3600, clock=clock)
+    ledger.record("gemini-pro", 2000, 0, tenant_id="t1")
+    assert ledger.check_budget(tenant_id="t1") == REJECT
+
+    clock.now += 3600
+    assert ledger.check_budget(tenant_id="t1") == OK
+    # Reporting totals survive the budget reset
+    assert ledger.summary()["tenant_id"]["t1"]["calls"] == 1
+
+    ledger.record("gemini-pro", 2000, 0, tenant_id="t1")
+    ledger.reset_budgets()
+    assert ledger.check_budget(tenant_id="t1") == OK
+
+
+def test_only_recent_sessions_are_tracked():
+    ledger = _ledger(max_tracked_keys=3)
+    for i in range(10):
+        ledger.record("gemini-pro", 10, 10, session_id=f"s{i}")
+    assert set(ledger.summary()["session_id"]) == {"s7", "s8", "s9"}
+    assert ledger.summary()["total"]["calls"] == 10
+
+
+def test_flush_writes_deltas_since_last_flush(tmp_path):
+    path = tmp_path / "usage.jsonl"
+    ledger = _ledger(flush_path=str(path), flush_interval=0)
+    ledger.flush()
+    assert not path.exists()
+
+    for i in range(ta.FLUSH_TOP + 5):
+        ledger.record("gemini-pro", 100, 10, session_id=f"s{i}")
+    ledger.flush()
+    ledger.record("gemini-pro", 1, 1, session_id="late")
+    ledger.close()
+    ledger.flush()
+
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert len(lines) == 2
+    assert lines[0]["total"]["calls"] == ta.FLUSH_TOP + 5
+    assert len(lines[0]["session_id"]) == ta.FLUSH_TOP
+    assert lines[1]["total"]["calls"] == 1
+    assert list(lines[1]["session_id"]) == ["late"]
+
+
+def test_background_flusher_writes_without_new_traffic(tmp_path):
+    path = tmp_path / "usage.jsonl"
+    ledger = _ledger(flush_path=str(path), flush_interval=0.05)
+    ledger.record("gemini-pro", 100, 10)
+    ledger._stop.wait(0.3)
+    ledger.close()
+    assert len(path.read_text().splitlines()) == 1
+
+
+def test_rejected_tenant_stays_rejected_after_other_tenants_call():
+    ledger = _ledger(session_budget={}, tenant_budget={"hard": 0.001}, max_tracked_keys=3)
+    ledger.record("gemini-pro", 2000, 0, tenant_id="greedy")
+    assert ledger.check_budget(tenant_id="greedy") == REJECT
+
+    for i in range(5):
+        ledger.record("gemini-pro", 10, 0, tenant_id=f"other{i}")
+    assert ledger.check_budget(tenant_id="greedy") == REJECT
+
+
+def test_degrade_caps_output_and_drops_expensive_tools():
+    from types import SimpleNamespace as NS
+
+    declarations = [NS(name="creative_reframe"), NS(name="rephrase_angry"), NS(name="validate_advice")]
+    request = NS(
+        model="gemini-2.5-flash-lite",
+        config=NS(max_output_tokens=None, tools=[NS(function_declarations=declarations)]),
+        tools_dict={d.name: object() for d in declarations},
+    )
+    ta.degrade_llm_request(request, drop_tools=("rephrase_angry", "validate_advice"))
+
+    assert request.config.max_output_tokens == ta.DEGRADED_MAX_OUTPUT_TOKENS
+    assert [d.name for d in request.config.tools[0].function_declarations] == ["creative_reframe"]
+    assert list(request.tools_dict) == ["creative_reframe"]
+
+    request.config.max_output_tokens = 100
+    ta.degrade_llm_request(request)
+    assert request.config.max_output_tokens == 100
@@ -0,0 +1,442 @@
+"""
+Professor Balthazar Magic Machine - Token Accounting
+Token and cost accounting with per-session and per-tenant budgets
+
+Every model call (the ADK agent turn, and ask_gemini calls from tools and
+graph.py's llm) is recorded with:
+1. Prompt/completion tokens and estimated cost
+2. Tags for session, tenant, tool and graph node
+3. In-memory aggregation, with usage deltas flushed to a JSONL file
+4. Daily budget checks that degrade to a cheaper model or reject the call
+"""
+
+import atexit
+import contextlib
+import contextvars
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+
+# =============================================================================
+# CONFIGURATION
+# =============================================================================
+
+# Estimated USD per 1M tokens: (prompt, completion)
+MODEL_PRICING = {
+    "gemini-pro": (0.50, 1.50),
+    "gemini-2.5-flash": (0.30, 2.50),
+    "gemini-2.5-flash-lite": (0.10, 0.40),
+}
+DEFAULT_PRICING = (0.50, 1.50)
+
+# Once a session or tenant passes its soft budget, ask_gemini switches to
+# CHEAP_MODEL and agent turns are capped at DEGRADED_MAX_OUTPUT_TOKENS
+# (the agent already runs on CHEAP_MODEL)
+CHEAP_MODEL = "gemini-2.5-flash-lite"
+DEGRADED_MAX_OUTPUT_TOKENS = 512
+
+# Budgets in estimated USD per BUDGET_WINDOW. Past "soft" calls degrade to
+# CHEAP_MODEL, past "hard" calls are rejected. None disables the limit.
+SESSION_BUDGET = {"soft": 0.05, "hard": 0.10}
+TENANT_BUDGET = {"soft": 1.00, "hard": 2.00}
+BUDGET_WINDOW = 24 * 60 * 60  # Daily
+
+# Usage since the last flush is appended to this file every FLUSH_INTERVAL
+# seconds (and at exit), keeping the FLUSH_TOP most expensive keys per dimension
+FLUSH_PATH = "token_usage.jsonl"
+FLUSH_INTERVAL = 60.0
+FLUSH_TOP = 10
+
+# Only the most recently seen sessions/tenants are kept in memory (keys past
+# their soft budget are kept until the budget window rolls over)
+MAX_TRACKED_KEYS = 1000
+
+OK = "ok"
+DEGRADE = "degrade"
+REJECT = "reject"
+
+
+class BudgetExceededError(RuntimeError):
+    """Raised when a session or tenant has spent its hard budget."""
+
+
+# =============================================================================
+# CALL TAGS
+# =============================================================================
+
+_session_id: contextvars.ContextVar = contextvars.ContextVar("session_id", default=None)
+_tenant_id: contextvars.ContextVar = contextvars.ContextVar("tenant_id", default=None)
+_tool: contextvars.ContextVar = contextvars.ContextVar("tool", default=None)
+_node: contextvars.ContextVar = contextvars.ContextVar("node", default=None)
+_TAGS = {"session_id": _session_id, "tenant_id": _tenant_id, "tool": _tool, "node": _node}
+
+
+@contextlib.contextmanager
+def accounting_scope(**tags: Optional[str]) -> Iterator[None]:
+    """
+    Tags every model call made inside the block.
+
+    Args:
+        **tags: Any of session_id, tenant_id, tool, node
+    """
+    tokens = [(_TAGS[name], _TAGS[name].set(value)) for name, value in tags.items()]
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+def current_tags() -> Dict[str, Optional[str]]:
+    """Returns the tags active for the current call."""
+    return {name: var.get() for name, var in _TAGS.items()}
+
+
+# =============================================================================
+# LEDGER
+# =============================================================================
+
+def _pricing(model: str) -> tuple:
+    """Looks up MODEL_PRICING by bare model name, falling back to the longest prefix match."""
+    name = normalise_model(model)
+    if name in MODEL_PRICING:
+        return MODEL_PRICING[name]
+    matches = [known for known in MODEL_PRICING if name.startswith(known)]
+    return MODEL_PRICING[max(matches, key=len)] if matches else DEFAULT_PRICING
+
+
+def normalise_model(model: str) -> str:
+    """Strips the "models/" prefix, e.g. models/gemini-pro -> gemini-pro."""
+    return (model or "").split("/")[-1]
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """Estimates the USD cost of a call from MODEL_PRICING."""
+    prompt_price, completion_price = _pricing(model)
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for responses that carry no usage metadata."""
+    return max(1, len(text or "") // 4)
+
+
+def _empty_totals() -> Dict[str, Any]:
+    return {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0}
+
+
+def _add(totals: Dict[str, Any], entry: Dict[str, Any]) -> None:
+    totals["calls"] += 1
+    totals["prompt_tokens"] += entry["prompt_tokens"]
+    totals["completion_tokens"] += entry["completion_tokens"]
+    totals["cost"] += entry["cost"]
+
+
+DIMENSIONS = ("session_id", "tenant_id", "tool", "node", "model")
+BUDGET_DIMENSIONS = ("session_id", "tenant_id")
+
+
+class TokenLedger:
+    """
+    Aggregates model usage in memory and enforces budgets.
+
+    Budgets apply to spend within the current window (BUDGET_WINDOW seconds),
+    so a tenant that hits its cap is served again once the window rolls over.
+
+    Args:
+        session_budget: {"soft": usd, "hard": usd} per session
+        tenant_budget: {"soft": usd, "hard": usd} per tenant
+        flush_path: JSONL file usage deltas are appended to (None disables)
+        flush_interval: Seconds between background flushes
+        budget_window: Seconds after which budget spend resets
+        max_tracked_keys: Most recently used sessions/tenants kept in memory
+        clock: Wall-clock function, injectable for tests
+    """
+
+    def __init__(
+        self,
+        session_budget: Optional[Dict[str, Optional[float]]] = None,
+        tenant_budget: Optional[Dict[str, Optional[float]]] = None,
+        flush_path: Optional[str] = FLUSH_PATH,
+        flush_interval: float = FLUSH_INTERVAL,
+        budget_window: float = BUDGET_WINDOW,
+        max_tracked_keys: int = MAX_TRACKED_KEYS,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.session_budget = session_budget or {}
+        self.tenant_budget = tenant_budget or {}
+        self.flush_path = flush_path
+        self.flush_interval = flush_interval
+        self.budget_window = budget_window
+        self.max_tracked_keys = max_tracked_keys
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+        self.reset()
+        if flush_path and flush_interval > 0:
+            self._flusher = threading.Thread(
+                target=self._flush_periodically, name="balthazar-token-flush", daemon=True
+            )
+            self._flusher.start()
+
+    def reset(self) -> None:
+        """Clears all aggregates and budget spend."""
+        with self._lock:
+            self._totals = _empty_totals()
+            self._by = {dimension: OrderedDict() for dimension in DIMENSIONS}
+            self._delta_totals = _empty_totals()
+            self._delta = {dimension: {} for dimension in DIMENSIONS}
+            self._window_start = self.clock()
+            self._window_spend = {dimension: OrderedDict() for dimension in BUDGET_DIMENSIONS}
+
+    def reset_budgets(self) -> None:
+        """Starts a new budget window now, forgiving all session and tenant spend."""
+        with self._lock:
+            self._window_start = self.clock()
+            for spend in self._window_spend.values():
+                spend.clear()
+
+    def _roll_window(self) -> None:
+        """Clears budget spend once the current window has elapsed (lock held)."""
+        now = self.clock()
+        if self.budget_window and now - self._window_start >= self.budget_window:
+            elapsed_windows = (now - self._window_start) // self.budget_window
+            self._window_start += elapsed_windows * self.budget_window
+            for spend in self._window_spend.values():
+                spend.clear()
+
+    def _trim(self, groups: "OrderedDict[str, Any]") -> None:
+        """Drops the least recently used keys beyond max_tracked_keys (lock held)."""
+        while len(groups) > self.max_tracked_keys:
+            groups.popitem(last=False)
+
+    def record(
+        self,
+        model: str,
+        prompt_tokens: int,
+        completion_tokens: int,
+        estimated: bool = False,
+        **tags: Optional[str],
+    ) -> Dict[str, Any]:
+        """
+        Records one model call.
+
+        Args:
+            model: Model name used for pricing
+            prompt_tokens: Tokens sent to the model
+            completion_tokens: Tokens generated by the model
+            estimated: Whether token counts are estimates
+            **tags: Overrides for session_id, tenant_id, tool, node
+
+        Returns:
+            Dictionary describing the recorded call
+        """
+        entry = current_tags()
+        entry.update({k: v for k, v in tags.items() if v is not None})
+        entry.update({
+            "model": normalise_model(model),
+            "prompt_tokens": int(prompt_tokens),
+            "completion_tokens": int(completion_tokens),
+            "cost": estimate_cost(model, prompt_tokens, completion_tokens),
+            "estimated": estimated,
+        })
+
+        with self._lock:
+            self._roll_window()
+            _add(self._totals, entry)
+            _add(self._delta_totals, entry)
+            for dimension in DIMENSIONS:
+                key = entry.get(dimension)
+                if key is None:
+                    continue
+                groups = self._by[dimension]
+                _add(groups.setdefault(key, _empty_totals()), entry)
+                groups.move_to_end(key)
+                self._trim(groups)
+                _add(self._delta[dimension].setdefault(key, _empty_totals()), entry)
+                if dimension in self._window_spend:
+                    spend = self._window_spend[dimension]
+                    spend[key] = spend.get(key, 0.0) + entry["cost"]
+                    spend.move_to_end(key)
+                    self._trim_spend(dimension)
+        return entry
+
+    def _trim_spend(self, dimension: str) -> None:
+        """
+        Drops the least recently used under-budget keys beyond max_tracked_keys (lock held).
+
+        Keys at or past their soft budget are kept until the window rolls
+        over, so an idle rejected tenant can't be evicted back to OK.
+        """
+        spend = self._window_spend[dimension]
+        budget = self.session_budget if dimension == "session_id" else self.tenant_budget
+        limit = min((v for v in (budget.get("soft"), budget.get("hard")) if v is not None),
+                    default=None)
+        excess = len(spend) - self.max_tracked_keys
+        if excess <= 0:
+            return
+        evictable = [key for key, cost in spend.items() if limit is None or cost < limit]
+        for key in evictable[:excess]:
+            del spend[key]
+
+    # -------------------------------------------------------------------------
+    # Budgets
+    # -------------------------------------------------------------------------
+
+    def spent(self, dimension: str, key: Optional[str]) -> float:
+        """Returns the estimated USD spent by a session or tenant in the current window."""
+        with self._lock:
+            self._roll_window()
+            if key is None:
+                return 0.0
+            return self._window_spend[dimension].get(key, 0.0)
+
+    def check_budget(
+        self, session_id: Optional[str] = None, tenant_id: Optional[str] = None
+    ) -> str:
+        """
+        Decides how the next call should proceed.
+
+        Args:
+            session_id: Session to check (defaults to the current scope)
+            tenant_id: Tenant to check (defaults to the current scope)
+
+        Returns:
+            OK, DEGRADE (use CHEAP_MODEL) or REJECT
+        """
+        tags = current_tags()
+        checks = [
+            (self.spent("session_id", session_id or tags["session_id"]), self.session_budget),
+            (self.spent("tenant_id", tenant_id or tags["tenant_id"]), self.tenant_budget),
+        ]
+        decision = OK
+        for spent, budget in checks:
+            if budget.get("hard") is not None and spent >= budget["hard"]:
+                return REJECT
+            if budget.get("soft") is not None and spent >= budget["soft"]:
+                decision = DEGRADE
+        return decision
+
+    def enforce_budget(
+        self, session_id: Optional[str] = None, tenant_id: Optional[str] = None
+    ) -> str:
+        """Like check_budget, but raises BudgetExceededError instead of returning REJECT."""
+        decision = self.check_budget(session_id, tenant_id)
+        if decision == REJECT:
+            tags = current_tags()
+            raise BudgetExceededError(
+                f"Budget exhausted for session={session_id or tags['session_id']} "
+                f"tenant={tenant_id or tags['tenant_id']}"
+            )
+        return decision
+
+    # -------------------------------------------------------------------------
+    # Reporting
+    # -------------------------------------------------------------------------
+
+    def summary(self, top: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Returns aggregated usage, most expensive first.
+
+        Sessions and tenants only cover the max_tracked_keys most recently seen.
+
+        Args:
+            top: Keep only the N most expensive keys per dimension
+
+        Returns:
+            Dictionary with overall totals and per-dimension breakdowns
+        """
+        with self._lock:
+            return _ranked(self._totals, self._by, top)
+
+    def flush(self) -> None:
+        """Appends usage since the last flush (top FLUSH_TOP keys per dimension) to flush_path."""
+        with self._lock:
+            if not self._delta_totals["calls"]:
+                return
+            snapshot = {"timestamp": self.clock(), **_ranked(self._delta_totals, self._delta, FLUSH_TOP)}
+            self._delta_totals = _empty_totals()
+            self._delta = {dimension: {} for dimension in DIMENSIONS}
+        if not self.flush_path:
+            return
+        try:
+            with open(self.flush_path, "a") as f:
+                f.write(json.dumps(snapshot) + "\n")
+        except OSError as e:
+            print(f"⚠️ Could not flush token usage: {e}")
+
+    def _flush_periodically(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def close(self) -> None:
+        """Stops the background flusher and writes any pending usage."""
+        self._stop.set()
+        self.flush()
+
+
+def _ranked(totals: Dict[str, Any], by: Dict[str, Dict[str, Any]], top: Optional[int]) -> Dict[str, Any]:
+    report: Dict[str, Any] = {"total": dict(totals)}
+    for dimension, groups in by.items():
+        ranked = sorted(groups.items(), key=lambda item: item[1]["cost"], reverse=True)
+        report[dimension] = {key: dict(group) for key, group in ranked[:top]}
+    return report
+
+
+def degrade_llm_request(
+    llm_request: Any,
+    drop_tools: Iterable[str] = (),
+    max_output_tokens: int = DEGRADED_MAX_OUTPUT_TOKENS,
+) -> Any:
+    """
+    Makes an ADK LlmRequest cheaper in place.
+
+    Caps max_output_tokens, and removes the named tools so the model can't
+    start the extra model calls they make.
+
+    Args:
+        llm_request: The request about to be sent to the model
+        drop_tools: Names of function tools to withhold
+        max_output_tokens: Output token cap
+
+    Returns:
+        The same request, for convenience
+    """
+    drop = set(drop_tools)
+    config = llm_request.config
+    config.max_output_tokens = min(config.max_output_tokens or max_output_tokens, max_output_tokens)
+    for tool in config.tools or []:
+        declarations = getattr(tool, "function_declarations", None)
+        if declarations:
+            tool.function_declarations = [d for d in declarations if d.name not in drop]
+    tools_dict = getattr(llm_request, "tools_dict", None)
+    if tools_dict:
+        for name in drop:
+            tools_dict.pop(name, None)
+    return llm_request
+
+
+LEDGER = TokenLedger(session_budget=SESSION_BUDGET, tenant_budget=TENANT_BUDGET)
+atexit.register(LEDGER.close)
+
+
+# =============================================================================
+# RESPONSE ADAPTERS
+# =============================================================================
+
+def record_genai_usage(model: str, prompt: str, response: Any, **tags: Optional[str]) -> Dict[str, Any]:
+    """Records a google.generativeai (or ADK LlmResponse) call."""
+    usage = getattr(response, "usage_metadata", None)
+    prompt_tokens = getattr(usage, "prompt_token_count", None)
+    completion_tokens = getattr(usage, "candidates_token_count", None)
+    if prompt_tokens is None or completion_tokens is None:
+        try:
+            text = response.text
+        except Exception:
+            text = ""
+        return LEDGER.record(model, estimate_tokens(prompt), estimate_tokens(text),
+                             estimated=True, **tags)
+    return LEDGER.record(model, prompt_tokens, completion_tokens, **tags)